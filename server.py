@@ -1,3 +1,4 @@
+import atexit
 import base64
 import json
 import logging
@@ -6,13 +7,24 @@ import os
 import pathlib
 import shlex
 import shutil
+import signal
 import subprocess
 import threading
+import time
+import uuid
 import wave
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 from dataclasses import dataclass
-from typing import Dict, List, Optional, Tuple
+from functools import lru_cache, partial
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
 
 from flask import Flask, Response, jsonify, redirect, render_template, request, send_file, url_for
+from flask.json.provider import JSONProvider
+
+try:
+    import orjson
+except ImportError:  # optional, falls back to Flask's stdlib json provider
+    orjson = None
 
 
 # ----- Configuration -----
@@ -22,9 +34,27 @@ THUMBS_DIR = TEMP_DIR / "thumbs"
 AUDIO_DIR = TEMP_DIR / "audio"
 PITCH_DIR = TEMP_DIR / "pitch"
 CONFIG_FILE = APP_ROOT / "config.json"
+META_FILE = TEMP_DIR / "meta.json"
 
 DOWNLOADS_DIR = pathlib.Path(os.path.expanduser("~/Downloads"))
 
+# Seconds before a stalled ffmpeg/sox/ffprobe is killed
+DEFAULT_CMD_TIMEOUT = float(os.environ.get("PITCH_CHANGE_CMD_TIMEOUT", "600"))
+
+CPU_COUNT = os.cpu_count() or 1
+# Half as many concurrent sox/ffmpeg encodes as cores, two threads each, so slots x threads ~= cores
+ENCODE_SLOTS = max(1, CPU_COUNT // 2)
+ENCODE_THREADS = max(1, CPU_COUNT // ENCODE_SLOTS)
+
+# Each thumbnail is its own ffmpeg process, so threads give real parallelism
+THUMB_EXECUTOR = ThreadPoolExecutor(max_workers=CPU_COUNT, thread_name_prefix="thumb")
+# Directory scans are latency bound (especially on network shares), not CPU bound
+WALK_EXECUTOR = ThreadPoolExecutor(max_workers=16, thread_name_prefix="walk")
+# Long-running extract/pitch/mux jobs, so request threads return immediately
+EXECUTOR = ThreadPoolExecutor(max_workers=CPU_COUNT, thread_name_prefix="job")
+# Speculative pitch shifts run one at a time so they never delay explicit jobs for long
+SPECULATIVE_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="speculative")
+
 
 def ensure_dirs() -> None:
     for p in [TEMP_DIR, THUMBS_DIR, AUDIO_DIR, PITCH_DIR, DOWNLOADS_DIR]:
@@ -34,8 +64,25 @@ def ensure_dirs() -> None:
 ensure_dirs()
 
 
+class OrjsonProvider(JSONProvider):
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        return orjson.dumps(obj).decode("utf-8")
+
+    def loads(self, s: Any, **kwargs: Any) -> Any:
+        return orjson.loads(s)
+
+    def response(self, *args: Any, **kwargs: Any) -> Response:
+        # Hand orjson's bytes straight to the response instead of via dumps()' str
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(orjson.dumps(obj), mimetype="application/json")
+
+
 app = Flask(__name__)
-app.config["JSON_SORT_KEYS"] = False
+if orjson is not None:
+    # orjson never sorts keys, so responses keep insertion order either way
+    app.json = OrjsonProvider(app)
+else:
+    app.json.sort_keys = False
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
 logger = logging.getLogger(__name__)
@@ -44,23 +91,84 @@ logger = logging.getLogger(__name__)
 # ----- Utilities -----
 
 
+@lru_cache(maxsize=8192)
 def b64url_encode_path(path_str: str) -> str:
     raw = path_str.encode("utf-8")
     b64 = base64.urlsafe_b64encode(raw).decode("ascii")
     return b64.rstrip("=")
 
 
+@lru_cache(maxsize=8192)
 def b64url_decode_path(b64_id: str) -> str:
     padding = "=" * (-len(b64_id) % 4)
     raw = base64.urlsafe_b64decode(b64_id + padding)
     return raw.decode("utf-8")
 
 
-def run_cmd(cmd: List[str]) -> Tuple[int, str, str]:
+_RUNNING_PROCS: Set[subprocess.Popen] = set()
+_PROCS_LOCK = threading.Lock()
+_SHUTTING_DOWN = threading.Event()
+
+
+def _kill_process_group(proc: subprocess.Popen) -> None:
+    try:
+        if hasattr(os, "killpg"):
+            os.killpg(proc.pid, signal.SIGKILL)
+        else:
+            proc.kill()
+    except OSError:
+        pass  # already exited
+
+
+def shutdown_workers() -> None:
+    """Drop queued background work and kill running ffmpeg/sox so the process can exit promptly."""
+    _SHUTTING_DOWN.set()
+    for executor in (THUMB_EXECUTOR, SPECULATIVE_EXECUTOR, EXECUTOR, WALK_EXECUTOR):
+        executor.shutdown(wait=False, cancel_futures=True)
+    with _PROCS_LOCK:
+        procs = list(_RUNNING_PROCS)
+    for proc in procs:
+        _kill_process_group(proc)
+
+
+# Executor workers are joined before atexit hooks run, so __main__ also calls this directly
+atexit.register(shutdown_workers)
+
+
+def run_cmd(
+    cmd: List[str],
+    capture: bool = False,
+    timeout: float = DEFAULT_CMD_TIMEOUT,
+    env: Optional[Dict[str, str]] = None,
+) -> Tuple[int, str, str]:
+    """Run ``cmd`` and return (returncode, stdout, stderr).
+
+    Without ``capture`` stdout goes to /dev/null and stderr is only decoded on failure.
+    A command still running after ``timeout`` seconds is killed along with its children.
+    """
+    if _SHUTTING_DOWN.is_set():
+        return -1, "", f"{cmd[0]} not started: server is shutting down"
     logger.info("Running: %s", " ".join(shlex.quote(c) for c in cmd))
-    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    out, err = proc.communicate()
-    return proc.returncode, out.decode("utf-8", errors="replace"), err.decode("utf-8", errors="replace")
+    stdout = subprocess.PIPE if capture else subprocess.DEVNULL
+    # Own session so a timeout can kill the whole process group; this also keeps
+    # Ctrl+C from reaching it, so shutdown_workers() kills running ones explicitly
+    proc = subprocess.Popen(cmd, stdout=stdout, stderr=subprocess.PIPE, start_new_session=True, env=env)
+    with _PROCS_LOCK:
+        _RUNNING_PROCS.add(proc)
+    try:
+        out, err = proc.communicate(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        _kill_process_group(proc)
+        proc.communicate()
+        logger.warning("Timed out after %gs: %s", timeout, cmd[0])
+        return proc.returncode, "", f"{cmd[0]} timed out after {timeout:g}s"
+    finally:
+        with _PROCS_LOCK:
+            _RUNNING_PROCS.discard(proc)
+    if not capture and proc.returncode == 0:
+        return proc.returncode, "", ""
+    out_s = out.decode("utf-8", errors="replace") if out is not None else ""
+    return proc.returncode, out_s, err.decode("utf-8", errors="replace")
 
 
 def ffprobe_duration_seconds(path: pathlib.Path) -> Optional[float]:
@@ -74,7 +182,7 @@ def ffprobe_duration_seconds(path: pathlib.Path) -> Optional[float]:
         "default=noprint_wrappers=1:nokey=1",
         str(path),
     ]
-    code, out, _ = run_cmd(cmd)
+    code, out, _ = run_cmd(cmd, capture=True)
     if code != 0:
         return None
     try:
@@ -95,32 +203,97 @@ def human_readable_duration(seconds: Optional[float]) -> str:
     return f"{m:02d}:{s:02d}"
 
 
+THUMB_TIMESTAMP = 1.0
+# Max number of inputs opened by one bulk thumbnail ffmpeg process
+THUMB_BATCH_SIZE = 8
+# How long /thumbs waits on a queued batch before answering 503
+THUMB_WAIT_SECONDS = 3.0
+
+
+def _thumbnail_input_args(video_path: pathlib.Path) -> List[str]:
+    # Input-side seek plus keyframe-only decoding: jump to the first keyframe after ts
+    return ["-threads", "1", "-skip_frame", "nokey", "-ss", str(THUMB_TIMESTAMP), "-i", str(video_path)]
+
+
+def _thumbnail_output_args(thumb_path: pathlib.Path) -> List[str]:
+    return ["-frames:v", "1", "-vsync", "0", "-q:v", "5", "-vf", "scale=320:-2", str(thumb_path)]
+
+
 def generate_thumbnail(video_path: pathlib.Path, thumb_path: pathlib.Path) -> None:
     if thumb_path.exists():
         return
     # Try to capture a frame at 10% duration, fallback to 1s if unknown
     # dur = ffprobe_duration_seconds(video_path) or 10.0
     # ts = max(1.0, dur * 0.1)
-    ts = 1.0
     # Generate thumbnail
-    cmd = [
-        "ffmpeg",
-        "-y",
-        "-ss",
-        str(ts),
-        "-i",
-        str(video_path),
-        "-vframes",
-        "1",
-        "-q:v",
-        "2",
-        str(thumb_path),
-    ]
+    cmd = ["ffmpeg", "-y"] + _thumbnail_input_args(video_path) + _thumbnail_output_args(thumb_path)
     code, _, err = run_cmd(cmd)
     if code != 0:
         logger.warning("Thumbnail generation failed for %s: %s", video_path, err)
 
 
+def generate_thumbnails_bulk(jobs: List[Tuple[pathlib.Path, pathlib.Path]]) -> None:
+    """Generate several thumbnails with a single ffmpeg process (one -i/-map pair per video)."""
+    jobs = [(v, t) for v, t in jobs if not t.exists()]
+    if not jobs:
+        return
+    if len(jobs) == 1:
+        generate_thumbnail(*jobs[0])
+        return
+    cmd = ["ffmpeg", "-y"]
+    for video_path, _ in jobs:
+        cmd += _thumbnail_input_args(video_path)
+    for i, (_, thumb_path) in enumerate(jobs):
+        cmd += ["-map", f"{i}:v:0"] + _thumbnail_output_args(thumb_path)
+    code, _, err = run_cmd(cmd)
+    if code != 0:
+        # One bad input fails the whole command; retry the remaining ones individually
+        logger.warning("Bulk thumbnail generation failed, retrying per video: %s", err)
+        for video_path, thumb_path in jobs:
+            generate_thumbnail(video_path, thumb_path)
+
+
+def _generate_thumbnails_safe(jobs: List[Tuple[pathlib.Path, pathlib.Path]]) -> None:
+    try:
+        generate_thumbnails_bulk(jobs)
+    except Exception as e:
+        logger.warning("Thumbnail generation error in %s: %s", jobs[0][0].parent, e)
+
+
+# thumb path -> future of the batch generating it, so nothing is generated twice
+_THUMB_PENDING: Dict[str, Future] = {}
+# Re-entrant: a batch that is already done runs its done-callback inside schedule_thumbnails
+_THUMB_LOCK = threading.RLock()
+
+
+def pending_thumbnail(thumb_path: pathlib.Path) -> Optional[Future]:
+    with _THUMB_LOCK:
+        return _THUMB_PENDING.get(str(thumb_path))
+
+
+def schedule_thumbnails(jobs: List[Tuple[pathlib.Path, pathlib.Path]]) -> None:
+    """Queue missing thumbnails on THUMB_EXECUTOR without waiting, batching videos that share a folder."""
+    by_folder: Dict[pathlib.Path, List[Tuple[pathlib.Path, pathlib.Path]]] = {}
+    with _THUMB_LOCK:
+        for video_path, thumb_path in jobs:
+            if str(thumb_path) not in _THUMB_PENDING and not thumb_path.exists():
+                by_folder.setdefault(video_path.parent, []).append((video_path, thumb_path))
+        for folder_jobs in by_folder.values():
+            for i in range(0, len(folder_jobs), THUMB_BATCH_SIZE):
+                batch = folder_jobs[i : i + THUMB_BATCH_SIZE]
+                keys = [str(thumb_path) for _, thumb_path in batch]
+                fut = THUMB_EXECUTOR.submit(_generate_thumbnails_safe, batch)
+                for key in keys:
+                    _THUMB_PENDING[key] = fut
+                fut.add_done_callback(partial(_thumbs_done, keys))
+
+
+def _thumbs_done(keys: List[str], _fut: Future) -> None:
+    with _THUMB_LOCK:
+        for key in keys:
+            _THUMB_PENDING.pop(key, None)
+
+
 def wav_duration_seconds(path: pathlib.Path) -> Optional[float]:
     try:
         with wave.open(str(path), "rb") as wf:
@@ -133,12 +306,81 @@ def wav_duration_seconds(path: pathlib.Path) -> Optional[float]:
         return None
 
 
+# Duration cache persisted to META_FILE: abs path -> {mtime_ns, size, duration_seconds}
+_META_CACHE: Optional[Dict[str, Dict[str, float]]] = None
+_META_LOCK = threading.Lock()
+
+
+def _load_meta_cache() -> Dict[str, Dict[str, float]]:
+    global _META_CACHE
+    if _META_CACHE is None:
+        _META_CACHE = {}
+        try:
+            if META_FILE.exists():
+                with open(META_FILE, "r", encoding="utf-8") as f:
+                    _META_CACHE = json.load(f).get("files", {})
+        except Exception as e:
+            logger.warning("Failed to load metadata cache: %s", e)
+    return _META_CACHE
+
+
+def _save_meta_cache() -> None:
+    try:
+        tmp = META_FILE.with_suffix(META_FILE.suffix + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"files": _META_CACHE}, f)
+        os.replace(tmp, META_FILE)
+    except Exception as e:
+        logger.warning("Failed to save metadata cache: %s", e)
+
+
+def get_duration_cached(path: pathlib.Path) -> Optional[float]:
+    """Duration of a media file, cached on disk until its mtime or size changes."""
+    try:
+        st = path.stat()
+    except OSError:
+        return None
+    key = str(path.absolute())
+    with _META_LOCK:
+        entry = _load_meta_cache().get(key)
+        if entry and entry["mtime_ns"] == st.st_mtime_ns and entry["size"] == st.st_size:
+            return entry["duration_seconds"]
+    duration = wav_duration_seconds(path) or ffprobe_duration_seconds(path)
+    if duration is None:
+        return None
+    with _META_LOCK:
+        _load_meta_cache()[key] = {"mtime_ns": st.st_mtime_ns, "size": st.st_size, "duration_seconds": duration}
+        _save_meta_cache()
+    return duration
+
+
+_ENCODE_SEMAPHORE = threading.BoundedSemaphore(ENCODE_SLOTS)
+
+
+# sox --multi-threaded uses OpenMP, which takes its thread count from the environment
+_ENCODE_ENV = dict(os.environ, OMP_NUM_THREADS=str(ENCODE_THREADS))
+
+
+def run_encode_cmd(cmd: List[str]) -> Tuple[int, str, str]:
+    # Bound concurrent encoders so bursts queue up instead of thrashing the CPU
+    with _ENCODE_SEMAPHORE:
+        return run_cmd(cmd, env=_ENCODE_ENV)
+
+
+def tmp_output_path(path: pathlib.Path) -> pathlib.Path:
+    # Keep the suffix so ffmpeg/sox still infer the container from it
+    return path.with_name(f".{path.stem}.tmp{path.suffix}")
+
+
 def extract_audio_wav(video_path: pathlib.Path, audio_out: pathlib.Path) -> None:
     if audio_out.exists():
         return
+    tmp = tmp_output_path(audio_out)
     cmd = [
         "ffmpeg",
         "-y",
+        "-threads",
+        str(ENCODE_THREADS),
         "-i",
         str(video_path),
         "-vn",
@@ -146,35 +388,102 @@ def extract_audio_wav(video_path: pathlib.Path, audio_out: pathlib.Path) -> None
         "pcm_s16le",
         "-ar",
         "48000",
-        str(audio_out),
+        "-threads",
+        str(ENCODE_THREADS),
+        str(tmp),
     ]
-    code, _, err = run_cmd(cmd)
+    code, _, err = run_encode_cmd(cmd)
     if code != 0:
+        tmp.unlink(missing_ok=True)
         raise RuntimeError(f"ffmpeg failed to extract audio: {err}")
+    os.replace(tmp, audio_out)
+
+
+def pitch_shift_np(input_wav: pathlib.Path, output_wav: pathlib.Path, semitones: int) -> None:
+    """In-process pitch shift with librosa, used when the sox binary is missing."""
+    try:
+        import librosa
+        import numpy as np
+        import soundfile as sf
+    except ImportError as e:
+        raise RuntimeError(f"sox not found and in-process pitch shift unavailable: {e}")
+    tmp = tmp_output_path(output_wav)
+    try:
+        with _ENCODE_SEMAPHORE:
+            x, sr = sf.read(str(input_wav), dtype="int16", always_2d=True)
+            # librosa wants channels first, float in [-1, 1)
+            y = librosa.effects.pitch_shift(x.T.astype(np.float32) / 32768.0, sr=sr, n_steps=semitones)
+            pcm = np.clip(y.T * 32768.0, -32768, 32767).astype(np.int16)
+            sf.write(str(tmp), pcm, sr, subtype="PCM_16")
+    except Exception:
+        tmp.unlink(missing_ok=True)
+        raise
+    os.replace(tmp, output_wav)
 
 
 def sox_pitch_shift_wav(input_wav: pathlib.Path, output_wav: pathlib.Path, semitones: int) -> None:
     if output_wav.exists():
         return
+    if shutil.which("sox") is None:
+        pitch_shift_np(input_wav, output_wav, semitones)
+        return
     cents = int(semitones) * 100
+    tmp = tmp_output_path(output_wav)
     cmd = [
         "sox",
         "-G",  # guard against clipping
+        "--multi-threaded",
+        "--buffer",
+        "131072",
         str(input_wav),
-        str(output_wav),
+        str(tmp),
         "pitch",
         str(cents),
     ]
-    code, _, err = run_cmd(cmd)
+    code, _, err = run_encode_cmd(cmd)
     if code != 0:
+        tmp.unlink(missing_ok=True)
         raise RuntimeError(f"SoX failed to pitch shift: {err}")
+    os.replace(tmp, output_wav)
+
+
+def remux_source_audio(video_path: pathlib.Path, output_path: pathlib.Path) -> bool:
+    # Unshifted export: the source's own audio track is what we'd encode, so copy both streams
+    tmp = tmp_output_path(output_path)
+    cmd = [
+        "ffmpeg",
+        "-y",
+        "-i",
+        str(video_path),
+        "-c",
+        "copy",
+        "-map",
+        "0:v:0",
+        "-map",
+        "0:a:0",
+        str(tmp),
+    ]
+    code, _, err = run_encode_cmd(cmd)
+    if code != 0:
+        tmp.unlink(missing_ok=True)
+        logger.warning("Stream copy failed for %s, re-encoding audio: %s", video_path, err)
+        return False
+    os.replace(tmp, output_path)
+    return True
 
 
-def mux_video_with_audio(video_path: pathlib.Path, audio_wav: pathlib.Path, output_path: pathlib.Path) -> None:
+def mux_video_with_audio(
+    video_path: pathlib.Path, audio_wav: pathlib.Path, output_path: pathlib.Path, semitones: int = 0
+) -> None:
+    if semitones == 0 and remux_source_audio(video_path, output_path):
+        return
     # Copy video stream, encode audio to AAC, don't re-encode video
+    tmp = tmp_output_path(output_path)
     cmd = [
         "ffmpeg",
         "-y",
+        "-threads",
+        str(ENCODE_THREADS),
         "-i",
         str(video_path),
         "-i",
@@ -190,11 +499,89 @@ def mux_video_with_audio(video_path: pathlib.Path, audio_wav: pathlib.Path, outp
         "-map",
         "1:a:0",
         "-shortest",
-        str(output_path),
+        "-threads",
+        str(ENCODE_THREADS),
+        str(tmp),
     ]
-    code, _, err = run_cmd(cmd)
+    code, _, err = run_encode_cmd(cmd)
     if code != 0:
+        tmp.unlink(missing_ok=True)
         raise RuntimeError(f"ffmpeg failed to mux: {err}")
+    os.replace(tmp, output_path)
+
+
+@lru_cache(maxsize=1)
+def ffmpeg_has_rubberband() -> bool:
+    try:
+        code, out, _ = run_cmd(["ffmpeg", "-hide_banner", "-filters"], capture=True)
+    except OSError:
+        return False
+    return code == 0 and " rubberband " in out
+
+
+def pitch_and_mux(video_path: pathlib.Path, semitones: int, output_path: pathlib.Path) -> None:
+    # Pitch-shift the source audio and mux in a single ffmpeg, without intermediate WAVs
+    tmp = tmp_output_path(output_path)
+    cmd = [
+        "ffmpeg",
+        "-y",
+        "-threads",
+        str(ENCODE_THREADS),
+        "-i",
+        str(video_path),
+        "-c:v",
+        "copy",
+        "-af",
+        f"rubberband=pitch={2 ** (semitones / 12)}",
+        "-c:a",
+        "aac",
+        "-b:a",
+        "192k",
+        "-map",
+        "0:v:0",
+        "-map",
+        "0:a:0",
+        "-threads",
+        str(ENCODE_THREADS),
+        str(tmp),
+    ]
+    code, _, err = run_encode_cmd(cmd)
+    if code != 0:
+        tmp.unlink(missing_ok=True)
+        raise RuntimeError(f"ffmpeg failed to pitch shift and mux: {err}")
+    os.replace(tmp, output_path)
+
+
+# export path -> (signature of the inputs that made it, signature of the export itself)
+_EXPORTS: Dict[str, Tuple[Tuple, Tuple]] = {}
+_EXPORTS_LOCK = threading.Lock()
+# export path -> lock held while writing it; jobs for different sources with the same name take turns
+_EXPORT_WRITE_LOCKS: Dict[str, threading.Lock] = {}
+
+
+def export_write_lock(output_path: pathlib.Path) -> threading.Lock:
+    with _EXPORTS_LOCK:
+        return _EXPORT_WRITE_LOCKS.setdefault(str(output_path), threading.Lock())
+
+
+def file_signature(path: pathlib.Path) -> Tuple[str, int, int]:
+    st = path.stat()
+    return str(path), st.st_mtime_ns, st.st_size
+
+
+def export_is_current(output_path: pathlib.Path, source: Tuple) -> bool:
+    """True if ``output_path`` was written by this process from exactly ``source`` and is untouched since."""
+    with _EXPORTS_LOCK:
+        record = _EXPORTS.get(str(output_path))
+    try:
+        return record is not None and record == (source, file_signature(output_path))
+    except OSError:
+        return False
+
+
+def record_export(output_path: pathlib.Path, source: Tuple) -> None:
+    with _EXPORTS_LOCK:
+        _EXPORTS[str(output_path)] = (source, file_signature(output_path))
 
 
 def audio_base_path_for_id(file_id: str) -> pathlib.Path:
@@ -227,19 +614,136 @@ def abort_json(status: int, message: str) -> Response:
     return resp
 
 
-def iter_mp4_files(root: pathlib.Path) -> List[pathlib.Path]:
-    results: List[pathlib.Path] = []
-    if not root.exists():
-        return results
-    for dirpath, _, filenames in os.walk(root):
-        for name in filenames:
-            if name.lower().endswith(".mp4"):
-                results.append(pathlib.Path(dirpath) / name)
+def _scan_dir(directory: str) -> Tuple[List[pathlib.Path], List[str]]:
+    # scandir gives us the entry type for free; only matched files become Path objects
+    files: List[pathlib.Path] = []
+    subdirs: List[str] = []
+    try:
+        with os.scandir(directory) as it:
+            for entry in it:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.path)
+                    elif entry.name.lower().endswith(".mp4"):
+                        files.append(pathlib.Path(entry.path))
+                except OSError:
+                    continue
+    except OSError:
+        # Unreadable directory; skip it like os.walk does
+        pass
+    return files, subdirs
+
+
+def scan_mp4_files(roots: List[pathlib.Path]) -> Dict[pathlib.Path, List[pathlib.Path]]:
+    """Walk several roots at once, scanning every directory as its own task on WALK_EXECUTOR."""
+    results: Dict[pathlib.Path, List[pathlib.Path]] = {root: [] for root in roots}
+    pending: Dict[Future, pathlib.Path] = {}
+    for root in roots:
+        if root.exists():
+            pending[WALK_EXECUTOR.submit(_scan_dir, str(root))] = root
+    # Workers never block on each other; subdirectories are fed back from this thread
+    while pending:
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for fut in done:
+            root = pending.pop(fut)
+            files, subdirs = fut.result()
+            results[root].extend(files)
+            for d in subdirs:
+                pending[WALK_EXECUTOR.submit(_scan_dir, d)] = root
+    for files in results.values():
+        files.sort()
     return results
 
 
+# root -> (mtime stamp, files found, monotonic time of the walk); replaced when the stamp changes
+_VIDEO_CACHE: Dict[str, Tuple[Tuple, List[pathlib.Path], float]] = {}
+# The stamp only sees one level down, so deeper changes are picked up after this long at most
+VIDEO_CACHE_TTL_SECONDS = 300.0
+_VIDEO_CACHE_LOCK = threading.Lock()
+
+
+def _dir_stamp(root: pathlib.Path) -> Optional[Tuple]:
+    # Root mtime plus its direct subdirectories' mtimes, so adds one level down are seen too
+    try:
+        root_mtime = os.stat(root).st_mtime_ns
+        with os.scandir(root) as it:
+            subdirs = sorted(
+                (entry.name, entry.stat(follow_symlinks=False).st_mtime_ns)
+                for entry in it
+                if entry.is_dir(follow_symlinks=False)
+            )
+    except OSError:
+        return None
+    return root_mtime, tuple(subdirs)
+
+
+def find_mp4_files_cached(
+    roots: List[pathlib.Path], refresh: bool = False
+) -> Dict[pathlib.Path, List[pathlib.Path]]:
+    """Like scan_mp4_files, but only re-walks roots whose directory mtimes changed.
+
+    Entries older than VIDEO_CACHE_TTL_SECONDS, or all of them with ``refresh``, are walked again.
+    """
+    results: Dict[pathlib.Path, List[pathlib.Path]] = {}
+    stale: Dict[pathlib.Path, Optional[Tuple]] = {}
+    now = time.monotonic()
+    for root in roots:
+        stamp = _dir_stamp(root)
+        with _VIDEO_CACHE_LOCK:
+            cached = _VIDEO_CACHE.get(str(root))
+        if (
+            not refresh
+            and stamp is not None
+            and cached is not None
+            and cached[0] == stamp
+            and now - cached[2] < VIDEO_CACHE_TTL_SECONDS
+        ):
+            results[root] = cached[1]
+        else:
+            stale[root] = stamp
+    if stale:
+        found = scan_mp4_files(list(stale))
+        with _VIDEO_CACHE_LOCK:
+            for root, stamp in stale.items():
+                if stamp is None:
+                    _VIDEO_CACHE.pop(str(root), None)
+                else:
+                    _VIDEO_CACHE[str(root)] = (stamp, found[root], now)
+        results.update(found)
+    # Keep the callers' root order
+    return {root: results[root] for root in roots}
+
+
+def _prewarm(roots: List[str]) -> None:
+    # Nobody reads this future's result, so errors must be logged here
+    try:
+        found = find_mp4_files_cached([pathlib.Path(r) for r in roots])
+        schedule_thumbnails(
+            [(path, thumb_path_for_id(b64url_encode_path(str(path)))) for paths in found.values() for path in paths]
+        )
+    except Exception:
+        logger.exception("Thumbnail prewarm failed for %s", roots)
+
+
+def prewarm_thumbnails(roots: List[str]) -> None:
+    """Walk ``roots`` and queue their missing thumbnails in the background."""
+    EXECUTOR.submit(_prewarm, list(roots))
+
+
 # In-memory state for search paths, persisted to CONFIG_FILE
 SEARCH_PATHS: List[str] = []
+# Raw user input -> resolved path; resolve() costs a syscall per path segment
+_RESOLVED_PATHS: Dict[str, str] = {}
+
+
+def normalize_search_path(path: str) -> str:
+    rp = _RESOLVED_PATHS.get(path)
+    if rp is None:
+        rp = str(pathlib.Path(path).resolve())
+        _RESOLVED_PATHS[path] = rp
+        # Already-resolved paths map to themselves, e.g. when the UI sends them back
+        _RESOLVED_PATHS[rp] = rp
+    return rp
 
 
 def load_search_paths() -> None:
@@ -254,7 +758,7 @@ def load_search_paths() -> None:
                 normalized: List[str] = []
                 for p in paths:
                     try:
-                        rp = str(pathlib.Path(p).resolve())
+                        rp = normalize_search_path(p)
                     except Exception:
                         rp = str(p)
                     if rp not in seen:
@@ -276,56 +780,141 @@ def save_search_paths() -> None:
         logger.warning("Failed to save config: %s", e)
 
 
+# Debounced config writes: a burst of path edits is written once
+SAVE_DELAY_SECONDS = 0.2
+_save_timer: Optional[threading.Timer] = None
+_save_lock = threading.Lock()
+
+
+def _do_save() -> None:
+    global _save_timer
+    with _save_lock:
+        if _save_timer is None:
+            return
+        _save_timer.cancel()
+        _save_timer = None
+        save_search_paths()
+
+
+def schedule_save() -> None:
+    global _save_timer
+    with _save_lock:
+        if _save_timer is not None:
+            _save_timer.cancel()
+        _save_timer = threading.Timer(SAVE_DELAY_SECONDS, _do_save)
+        _save_timer.daemon = True
+        _save_timer.start()
+
+
+# Flush a pending write on shutdown
+atexit.register(_do_save)
+
+
 # Load persisted paths at startup
 load_search_paths()
 
 
-# ----- Range file serving for audio seeking -----
+# ----- Background jobs -----
+
+
+# job id -> future resolving to the JSON payload of the finished request
+JOBS: Dict[str, Future] = {}
+# output key -> job id of the job producing it, so concurrent requests share one job
+_JOB_KEYS: Dict[str, str] = {}
+# job id -> monotonic time the job was first seen finished
+_JOB_DONE_AT: Dict[str, float] = {}
+# ids of jobs running on SPECULATIVE_EXECUTOR
+_SPECULATIVE_JOBS: Set[str] = set()
+_JOBS_LOCK = threading.Lock()
+# Finished jobs (and their results) are forgotten after this long
+JOB_TTL_SECONDS = 600.0
+
+
+def _prune_jobs() -> None:
+    # Caller holds _JOBS_LOCK
+    now = time.monotonic()
+    for job_id, fut in list(JOBS.items()):
+        if fut.done() and now - _JOB_DONE_AT.setdefault(job_id, now) > JOB_TTL_SECONDS:
+            del JOBS[job_id]
+            del _JOB_DONE_AT[job_id]
+            _SPECULATIVE_JOBS.discard(job_id)
+    for key, job_id in list(_JOB_KEYS.items()):
+        if job_id not in JOBS:
+            del _JOB_KEYS[key]
+
+
+def job_in_flight(key: str) -> bool:
+    with _JOBS_LOCK:
+        job_id = _JOB_KEYS.get(key)
+        return job_id is not None and not JOBS[job_id].done()
+
+
+def submit_job(key: str, work: Callable[[], Dict[str, Any]], speculative: bool = False) -> str:
+    with _JOBS_LOCK:
+        _prune_jobs()
+        job_id = _JOB_KEYS.get(key)
+        # A user asking for a still-queued speculative job gets it moved to the main pool
+        if job_id in _SPECULATIVE_JOBS and not speculative and JOBS[job_id].cancel():
+            job_id = None
+        if job_id is None or JOBS[job_id].done():
+            job_id = uuid.uuid4().hex
+            executor = SPECULATIVE_EXECUTOR if speculative else EXECUTOR
+            JOBS[job_id] = executor.submit(work)
+            _JOB_KEYS[key] = job_id
+            if speculative:
+                _SPECULATIVE_JOBS.add(job_id)
+    return job_id
+
+
+def run_as_job(key: str, output: Optional[pathlib.Path], work: Callable[[], Dict[str, Any]]) -> Response:
+    """Run ``work`` on EXECUTOR and answer 202 with a job id to poll.
+
+    If ``output`` already exists and nothing is still writing it, ``work`` is
+    cheap and runs inline so cached results come back in one round trip.
+    """
+    if output is not None and output.exists() and not job_in_flight(key):
+        try:
+            return jsonify(work())
+        except Exception as e:
+            return abort_json(500, str(e))
+    job_id = submit_job(key, work)
+    resp = jsonify({"job_id": job_id, "status": "running", "status_url": url_for("api_job_status", job_id=job_id)})
+    resp.status_code = 202
+    return resp
 
 
-def send_file_range(path: pathlib.Path, mimetype: Optional[str] = None) -> Response:
-    file_size = path.stat().st_size
-    range_header = request.headers.get("Range")
-    if not range_header:
-        resp = send_file(str(path), mimetype=mimetype, conditional=True)
-        try:
-            resp.headers["Cache-Control"] = "no-store"
-            resp.headers["Accept-Ranges"] = "bytes"
-        except Exception:
-            pass
-        return resp
+# Shifts users usually try right after extracting; pre-computed in the background
+SPECULATIVE_SEMITONES = (-2, -1, 1, 2)
 
-    # Parse Range: bytes=start-end
-    try:
-        units, _, range_spec = range_header.partition("=")
-        if units != "bytes":
-            raise ValueError("Only bytes supported")
-        start_s, _, end_s = range_spec.partition("-")
-        start = int(start_s) if start_s else 0
-        end = int(end_s) if end_s else file_size - 1
-        if end >= file_size:
-            end = file_size - 1
-        length = end - start + 1
-    except Exception:
-        # Malformed range; fall back to full file with no-store headers
-        resp = send_file(str(path), mimetype=mimetype, conditional=True)
-        try:
-            resp.headers["Cache-Control"] = "no-store"
-            resp.headers["Accept-Ranges"] = "bytes"
-        except Exception:
-            pass
-        return resp
 
-    with open(path, "rb") as f:
-        f.seek(start)
-        data = f.read(length)
+def pitch_job(file_id: str, semitones: int, audio_url: str) -> Callable[[], Dict[str, Any]]:
+    base_audio = audio_base_path_for_id(file_id)
+    out = pitched_audio_path_for_id(file_id, semitones)
+
+    def work() -> Dict[str, Any]:
+        sox_pitch_shift_wav(base_audio, out, semitones)
+        duration = get_duration_cached(out) or get_duration_cached(base_audio)
+        return {
+            "ok": True,
+            "audio_url": audio_url,
+            "duration_seconds": duration,
+            "duration": human_readable_duration(duration),
+        }
+
+    return work
 
-    rv = Response(data, 206, mimetype=mimetype, direct_passthrough=True)
-    rv.headers.add("Content-Range", f"bytes {start}-{end}/{file_size}")
-    rv.headers.add("Accept-Ranges", "bytes")
-    rv.headers.add("Content-Length", str(length))
-    rv.headers.add("Cache-Control", "no-store")
-    return rv
+
+# ----- Range file serving for audio seeking -----
+
+
+def send_file_range(
+    path: pathlib.Path, mimetype: Optional[str] = None, cache_control: str = "no-cache"
+) -> Response:
+    # Werkzeug parses Range itself (206 + Content-Range) and streams via wsgi.file_wrapper
+    resp = send_file(str(path), mimetype=mimetype, conditional=True)
+    resp.headers["Cache-Control"] = cache_control
+    resp.headers["Accept-Ranges"] = "bytes"
+    return resp
 
 
 # ----- Routes -----
@@ -352,10 +941,11 @@ def add_path() -> Response:
     path = data.get("path")
     if not path:
         return abort_json(400, "Missing 'path'")
-    p = str(pathlib.Path(path).resolve())
+    p = normalize_search_path(path)
     if p not in SEARCH_PATHS:
         SEARCH_PATHS.append(p)
-        save_search_paths()
+        schedule_save()
+        prewarm_thumbnails([p])
     return jsonify({"ok": True, "paths": SEARCH_PATHS})
 
 
@@ -365,10 +955,10 @@ def remove_path() -> Response:
     path = data.get("path")
     if not path:
         return abort_json(400, "Missing 'path'")
-    p = str(pathlib.Path(path).resolve())
+    p = normalize_search_path(path)
     try:
         SEARCH_PATHS.remove(p)
-        save_search_paths()
+        schedule_save()
     except ValueError:
         pass
     return jsonify({"ok": True, "paths": SEARCH_PATHS})
@@ -377,14 +967,16 @@ def remove_path() -> Response:
 @app.get("/api/videos")
 def list_videos() -> Response:
     videos = []
-    for root in SEARCH_PATHS:
-        for path in iter_mp4_files(pathlib.Path(root)):
+    todo: List[Tuple[pathlib.Path, pathlib.Path]] = []
+    # The UI's Refresh button passes refresh=1 to force a full re-walk
+    refresh = request.args.get("refresh") == "1"
+    found = find_mp4_files_cached([pathlib.Path(r) for r in SEARCH_PATHS], refresh=refresh)
+    for paths in found.values():
+        for path in paths:
             file_id = b64url_encode_path(str(path))
             thumb_path = thumb_path_for_id(file_id)
-            try:
-                generate_thumbnail(path, thumb_path)
-            except Exception as e:
-                logger.warning("Thumbnail generation error: %s", e)
+            if not thumb_path.exists():
+                todo.append((path, thumb_path))
             videos.append(
                 {
                     "id": file_id,
@@ -392,6 +984,8 @@ def list_videos() -> Response:
                     "thumbnail": url_for("get_thumb", file_id=file_id),
                 }
             )
+    # Usually already prewarmed; anything left is queued and served by get_thumb once ready
+    schedule_thumbnails(todo)
     # Deduplicate by id in case overlapping paths
     seen = set()
     unique = []
@@ -406,15 +1000,29 @@ def list_videos() -> Response:
 def get_thumb(file_id: str) -> Response:
     p = thumb_path_for_id(file_id)
     if not p.exists():
-        # Attempt regeneration if possible
-        try:
-            video_path = pathlib.Path(b64url_decode_path(file_id))
-            generate_thumbnail(video_path, p)
-        except Exception:
-            pass
+        fut = pending_thumbnail(p)
+        if fut is not None:
+            # Queued in a batch: wait briefly, then let the page retry instead of holding this thread
+            try:
+                fut.result(timeout=THUMB_WAIT_SECONDS)
+            except Exception:
+                pass
+            if not p.exists():
+                resp = abort_json(503, "Thumbnail is being generated")
+                resp.headers["Retry-After"] = str(max(1, int(THUMB_WAIT_SECONDS)))
+                return resp
+        else:
+            # Attempt regeneration if possible
+            try:
+                video_path = pathlib.Path(b64url_decode_path(file_id))
+                generate_thumbnail(video_path, p)
+            except Exception:
+                pass
     if not p.exists():
         return abort_json(404, "Thumbnail not found")
-    return send_file(str(p), mimetype="image/jpeg")
+    resp = send_file(str(p), mimetype="image/jpeg", conditional=True)
+    resp.headers["Cache-Control"] = "public, max-age=3600"
+    return resp
 
 
 @app.post("/api/extract-audio")
@@ -427,22 +1035,26 @@ def api_extract_audio() -> Response:
     if isinstance(video_path, Response):
         return video_path
     audio_out = audio_base_path_for_id(file_id)
-    try:
-        extract_audio_wav(video_path, audio_out)
-    except Exception as e:
-        return abort_json(500, str(e))
+    audio_url = url_for("serve_audio", id=file_id, pitch=0)
+    # url_for needs the request context, so build the neighbours' URLs here
+    neighbour_urls = {s: url_for("serve_audio", id=file_id, pitch=s) for s in SPECULATIVE_SEMITONES}
 
-    # Prefer native WAV duration if ffprobe is unavailable
-    duration = wav_duration_seconds(audio_out) or ffprobe_duration_seconds(audio_out)
-    return jsonify(
-        {
+    def work() -> Dict[str, Any]:
+        extract_audio_wav(video_path, audio_out)
+        for s, url in neighbour_urls.items():
+            out = pitched_audio_path_for_id(file_id, s)
+            if not out.exists():
+                submit_job(str(out), pitch_job(file_id, s, url), speculative=True)
+        duration = get_duration_cached(audio_out)
+        return {
             "ok": True,
-            "audio_url": url_for("serve_audio", id=file_id, pitch=0),
+            "audio_url": audio_url,
             "duration_seconds": duration,
             "duration": human_readable_duration(duration),
             "filename": video_path.name,
         }
-    )
+
+    return run_as_job(str(audio_out), audio_out, work)
 
 
 @app.get("/api/audio-meta/<file_id>")
@@ -450,7 +1062,7 @@ def api_audio_meta(file_id: str) -> Response:
     audio_path = audio_base_path_for_id(file_id)
     if not audio_path.exists():
         return abort_json(404, "Audio not extracted")
-    duration = wav_duration_seconds(audio_path) or ffprobe_duration_seconds(audio_path)
+    duration = get_duration_cached(audio_path)
     return jsonify(
         {
             "duration_seconds": duration,
@@ -483,6 +1095,7 @@ def serve_audio() -> Response:
         p = pitched_audio_path_for_id(file_id, pitch)
     if not p.exists():
         return abort_json(404, "Audio not found")
+    # Base and pitched WAVs are written once via os.replace, so the browser may keep them and revalidate (ETag -> 304)
     return send_file_range(p, mimetypes.guess_type(str(p))[0] or "audio/wav")
 
 
@@ -499,24 +1112,8 @@ def api_pitch() -> Response:
     if not base_audio.exists():
         return abort_json(400, "Base audio not extracted yet")
     out = pitched_audio_path_for_id(file_id, semitones)
-    try:
-        sox_pitch_shift_wav(base_audio, out, semitones)
-    except Exception as e:
-        return abort_json(500, str(e))
-    duration = (
-        wav_duration_seconds(out)
-        or wav_duration_seconds(base_audio)
-        or ffprobe_duration_seconds(out)
-        or ffprobe_duration_seconds(base_audio)
-    )
-    return jsonify(
-        {
-            "ok": True,
-            "audio_url": url_for("serve_audio", id=file_id, pitch=semitones),
-            "duration_seconds": duration,
-            "duration": human_readable_duration(duration),
-        }
-    )
+    work = pitch_job(file_id, semitones, url_for("serve_audio", id=file_id, pitch=semitones))
+    return run_as_job(str(out), out, work)
 
 
 @app.post("/api/store-video")
@@ -526,6 +1123,8 @@ def api_store_video() -> Response:
     semitones = int(data.get("semitones", 0))
     if file_id is None:
         return abort_json(400, "Missing 'id'")
+    if semitones < -8 or semitones > 8:
+        return abort_json(400, "'semitones' must be between -8 and 8")
     video_path = get_video_path_from_id_or_404(file_id)
     if isinstance(video_path, Response):
         return video_path
@@ -535,17 +1134,53 @@ def api_store_video() -> Response:
         if semitones != 0
         else audio_base_path_for_id(file_id)
     )
-    if not audio_path.exists():
+    # Without a previewed WAV, shift straight from the source if ffmpeg can
+    direct = semitones != 0 and not audio_path.exists() and ffmpeg_has_rubberband()
+    if not audio_path.exists() and not direct:
         return abort_json(400, "Requested audio not available. Generate it first.")
+    inputs = [video_path] if direct else [video_path, audio_path]
     base = video_path.stem
     sign = "+" if semitones >= 0 else "-"
     out_name = f"{base}_{sign}{abs(int(semitones))}.mp4"
     out_path = DOWNLOADS_DIR / out_name
-    try:
-        mux_video_with_audio(video_path, audio_path, out_path)
-    except Exception as e:
-        return abort_json(500, str(e))
-    return jsonify({"ok": True, "output_path": str(out_path)})
+
+    # Exports are named by stem only, so reuse one only if we made it from these exact inputs
+    source = (semitones, direct, tuple(file_signature(p) for p in inputs))
+
+    def work() -> Dict[str, Any]:
+        with export_write_lock(out_path):
+            if not export_is_current(out_path, source):
+                if direct:
+                    pitch_and_mux(video_path, semitones, out_path)
+                else:
+                    mux_video_with_audio(video_path, audio_path, out_path, semitones)
+                record_export(out_path, source)
+        return {"ok": True, "output_path": str(out_path)}
+
+    # Only requests with identical inputs may share a job
+    key = f"{out_path}|{source}"
+    return run_as_job(key, out_path if export_is_current(out_path, source) else None, work)
+
+
+@app.get("/api/jobs/<job_id>")
+def api_job_status(job_id: str) -> Response:
+    with _JOBS_LOCK:
+        _prune_jobs()
+        fut = JOBS.get(job_id)
+    if fut is None:
+        return abort_json(404, "Job not found")
+    if not fut.done():
+        return jsonify({"job_id": job_id, "status": "running"})
+    if fut.cancelled():
+        resp = jsonify({"job_id": job_id, "status": "error", "error": "Job was cancelled"})
+        resp.status_code = 500
+        return resp
+    exc = fut.exception()
+    if exc is not None:
+        resp = jsonify({"job_id": job_id, "status": "error", "error": str(exc)})
+        resp.status_code = 500
+        return resp
+    return jsonify({"job_id": job_id, "status": "done", "result": fut.result()})
 
 
 # ----- Static assets -----
@@ -557,6 +1192,19 @@ def healthz() -> Response:
 
 
 if __name__ == "__main__":
-    app.run(host="127.0.0.1", port=5001, debug=True)
+    debug = bool(os.environ.get("PITCH_CHANGE_DEBUG"))
+    # With the reloader, only the serving child process should prewarm
+    if not debug or os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        prewarm_thumbnails(SEARCH_PATHS)
+    try:
+        if debug:
+            # Werkzeug dev server with reloader and debugger, for development only
+            app.run(host="127.0.0.1", port=5001, debug=True)
+        else:
+            from waitress import serve
+
+            serve(app, host="127.0.0.1", port=5001, threads=16)
+    finally:
+        shutdown_workers()
 
 